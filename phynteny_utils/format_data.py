@@ -12,7 +12,6 @@ import numpy as np
 import pickle5
 from loguru import logger
 from sklearn.model_selection import train_test_split
-from tensorflow.keras.preprocessing.sequence import pad_sequences
 
 
 def instantiate_dir(output_dir, force):
@@ -54,10 +53,10 @@ def get_dict(dict_path):
         if any(dictionary):
             logger.info(f"dictionary loaded from {dict_path}")
         else:
-            logger.crtical(
+            logger.critical(
                 f"dictionary could not be loaded from {dict_path}. Is it empty?"
             )
-    handle.close()
+
     return dictionary
 
 
@@ -69,13 +68,9 @@ def encode_strand(strand):
     :return: one hot encoding as two separate numpy arrays
     """
 
-    encode = np.array([2 if i == "+" else 1 for i in strand])
-
-    strand_encode = np.array([1 if i == 1 else 0 for i in encode]), np.array(
-        [1 if i == 2 else 0 for i in encode]
-    )
+    forward = np.asarray(strand) == "+"
 
-    return strand_encode[0], strand_encode[1]
+    return (~forward).astype(int), forward.astype(int)
 
 
 def encode_start(gene_positions):
@@ -86,7 +81,8 @@ def encode_start(gene_positions):
     :return: vector of encoded gene positions
     """
 
-    start = np.array([i[0] - gene_positions[0][0] for i in gene_positions])
+    positions = np.asarray(gene_positions).reshape(-1, 2)
+    start = positions[:, 0] - positions[0, 0]
 
     return np.round(start / np.max(start), 3)
 
@@ -99,14 +95,13 @@ def encode_intergenic(gene_positions):
     :return: vector of intergenic gaps
     """
 
-    intergenic = [
-        gene_positions[i + 1][0] - gene_positions[i][1]
-        for i in range(len(gene_positions) - 1)
-    ]
+    positions = np.asarray(gene_positions).reshape(-1, 2)
 
-    intergenic.insert(0, 0)
+    # first gene has no upstream neighbour
+    intergenic = np.zeros(len(positions), dtype=positions.dtype)
+    intergenic[1:] = positions[1:, 0] - positions[:-1, 1]
 
-    return np.array(intergenic)
+    return intergenic
 
 
 def count_direction(strand):
@@ -117,21 +112,15 @@ def count_direction(strand):
     :return: List of counts of genes occuring with the same orientation
     """
 
-    direction_count = []
-    counter = 0
-
-    for i in range(len(strand) - 1):
-        if strand[i] == strand[i + 1]:
-            counter += 1
-
-        else:
-            counter = 0
+    strand = np.asarray(strand)
+    index = np.arange(len(strand))
 
-        direction_count.append(counter)
+    # index of the first gene in each run of genes with the same orientation
+    run_start = np.zeros(len(strand), dtype=bool)
+    run_start[1:] = strand[1:] != strand[:-1]
+    run_start = np.maximum.accumulate(np.where(run_start, index, 0))
 
-    direction_count.insert(0, 0)
-
-    return np.array(direction_count)
+    return index - run_start
 
 
 def one_hot_encode(sequence, num_functions):
@@ -143,13 +132,13 @@ def one_hot_encode(sequence, num_functions):
     :return: numpy array containing one hot encoding
     """
 
-    encoding = list()
-    for value in sequence:
-        vector = [0 for i in range(num_functions)]
-        vector[value] = 1
-        encoding.append(vector)
+    sequence = np.asarray(sequence)
+
+    # integer arrays are used as indices directly rather than copied to a wider integer type
+    if sequence.dtype.kind not in "iu":
+        sequence = sequence.astype(int)
 
-    return np.array(encoding)
+    return np.eye(num_functions, dtype=np.float32)[sequence]
 
 
 def one_hot_decode(encoded_seq):
@@ -159,7 +148,42 @@ def one_hot_decode(encoded_seq):
     :param encoded_seq: one_hot encoding of the sequence
     :return: integer encoding of the PHROG cateogries present in a sequence
     """
-    return [np.argmax(vector) for vector in encoded_seq]
+    return np.argmax(encoded_seq, axis=1)
+
+
+def prepare_sequence(sequence, num_functions, max_length):
+    """
+    Pad and one hot encode a sequence of PHROG categories.
+    Only needs to be computed once for a sequence regardless of how many genes are masked
+
+    :param sequence: integer encoded list of PHROG categories in a sequence
+    :param num_functions: number of possible PHROG categories
+    :param max_length: maximum length of a sequence
+    :return: one hot encoding of the padded sequence
+    """
+
+    # pad the end of the sequence. Sequences longer than max_length keep their last max_length genes
+    sequence = np.asarray(sequence, dtype=np.int32)[-max_length:]
+    padded_sequence = np.zeros(max_length, dtype=np.int32)
+    padded_sequence[: len(sequence)] = sequence
+
+    return one_hot_encode(padded_sequence, num_functions)
+
+
+def apply_mask(encoding, idx, num_functions):
+    """
+    Mask the category of a single gene in an encoded sequence
+
+    :param encoding: one hot encoding of a sequence generated with prepare_sequence
+    :param idx: index of the gene to mask
+    :param num_functions: number of possible PHROG categories
+    :return: copy of the encoding with the masked gene set to zero
+    """
+
+    X = encoding.copy()
+    X[idx, 0:num_functions] = 0
+
+    return X
 
 
 def generate_example(sequence, num_functions, max_length, idx, unmask=False):
@@ -179,20 +203,17 @@ def generate_example(sequence, num_functions, max_length, idx, unmask=False):
     if seq_len > max_length:
         ValueError("Phage contains more genes than the maximum specified!")
 
-    # pad the sequence
-    padded_sequence = pad_sequences([sequence], padding="post", maxlen=max_length)[0]
-
     # generate encoding
-    y = np.array(one_hot_encode(padded_sequence, num_functions))
-    X = np.array(one_hot_encode(padded_sequence, num_functions))
+    X = prepare_sequence(sequence, num_functions, max_length)
+
+    # return y just as this masked function
+    y = X[idx].copy()
 
     # replace the function encoding for the masked sequence
+    # the encoding is not shared so mask in place rather than copying
     if not unmask:
         print("Doing the masking")
-        X[idx] = np.zeros(num_functions)
-
-    # return y just as this masked function
-    y = y[idx]
+        X[idx, 0:num_functions] = 0
 
     # reshape the matrices
     X = X.reshape((1, max_length, num_functions))
@@ -212,13 +233,10 @@ def generate_prediction(sequence, num_functions, max_length, idx):
     """
 
     # construct features
-    seq_len = len(sequence)
-    padded_sequence = pad_sequences(sequence, padding="post", maxlen=max_length)[0]
-
-    X = np.array(one_hot_encode(padded_sequence, num_functions))
+    X = prepare_sequence(sequence[0], num_functions, max_length)
 
     # mask the unknown
-    X[idx, 0:num_functions] = np.zeros(num_functions)
+    X[idx, 0:num_functions] = 0
 
     return X.reshape((1, max_length, num_functions))
 
@@ -233,14 +251,17 @@ def generate_dataset(data, num_functions, max_length, unmask=False):
     :param unmask: specify if masking should be ignored
     :return: dataset framed for supervised learning
     :return: list of indices masked for each instance in the dataset
-    """
 
-    # features is a list of list objects
-    X = []
-    y = []
+    The arrays are allocated once for the whole dataset. Peak memory is approximately the size of X, which is
+    4 x number of prophages x max_length x num_functions bytes, plus one byte per gene position for the categories
+    """
 
     keys = list(data.keys())
 
+    # padded category of each gene - padding is encoded as the unknown category
+    padded = np.zeros((len(keys), max_length), dtype=np.int8)
+    masked_idx = np.zeros(len(keys), dtype=int)
+
     for i in range(len(keys)):
         # get the encoding
         encoding = data.get(keys[i]).get("categories")
@@ -259,18 +280,19 @@ def generate_dataset(data, num_functions, max_length, unmask=False):
             while encoding[idx] == 0:
                 idx = random.randint(1, len(encoding) - 1)
 
-        # generate example
-        this_X, this_y = generate_example(
-            encoding, num_functions, max_length, idx, unmask
-        )
+        padded[i, : len(encoding)] = encoding
+        masked_idx[i] = idx
 
-        # store the data
-        X.append(this_X)
-        y.append(this_y)
+    # encode every prophage at once
+    X = one_hot_encode(padded, num_functions)
 
-    # reshape the data
-    X = np.array(X).reshape(len(keys), max_length, num_functions)
-    y = np.array(y).reshape(len(keys), num_functions)
+    # y is just the masked function
+    rows = np.arange(len(keys))
+    y = X[rows, masked_idx]
+
+    # replace the function encoding for the masked genes
+    if not unmask:
+        X[rows, masked_idx] = 0
 
     return X, y
 
@@ -293,10 +315,8 @@ def test_train(data, path, num_functions, max_genes=120, test_size=10, unmask=Fa
     # encode the data
     print("Unmask: " + str(unmask))
     X, y = generate_dataset(data, num_functions, max_genes, unmask)
-    X_dict = dict(zip(keys, X))
-    y_dict = dict(zip(keys, y))
 
-    categories = [np.where(y[i] == 1)[0][0] for i in range(len(X))]
+    categories = np.argmax(y, axis=1)
 
     train_keys, test_keys, train_cat, test_cat = train_test_split(
         [i for i in range(len(categories))],
@@ -307,35 +327,26 @@ def test_train(data, path, num_functions, max_genes=120, test_size=10, unmask=Fa
     )
 
     # generate a dictionary of training data which can be used
-    train_X_data = dict(
-        zip([keys[i] for i in train_keys], [X_dict.get(keys[i]) for i in train_keys])
-    )
-    train_y_data = dict(
-        zip([keys[i] for i in train_keys], [y_dict.get(keys[i]) for i in train_keys])
-    )
-    test_X_data = dict(
-        zip([keys[i] for i in test_keys], [X_dict.get(keys[i]) for i in test_keys])
-    )
-    test_y_data = dict(
-        zip([keys[i] for i in test_keys], [y_dict.get(keys[i]) for i in test_keys])
-    )
+    train_X_data = {keys[i]: X[i] for i in train_keys}
+    train_y_data = {keys[i]: y[i] for i in train_keys}
+    test_X_data = {keys[i]: X[i] for i in test_keys}
+    test_y_data = {keys[i]: y[i] for i in test_keys}
 
     # for the test data get the entire prophages because these can be used to test annotation of the entire genome
-    test_phage = dict(zip(test_keys, [data.get(i) for i in test_keys]))
+    test_phage = {keys[i]: data[keys[i]] for i in test_keys}
+
+    # save the training data as arrays which can be memory-mapped when training
+    np.save(path + "_train_X.npy", X.astype(np.int8)[train_keys])
+    np.save(path + "_train_y.npy", categories[train_keys].astype(np.int32))
 
     # save each of these dictionaries
     with open(path + "_train_X.pkl", "wb") as handle:
-        pickle5.dump(train_X_data, handle)
-    handle.close()
+        pickle5.dump(train_X_data, handle, protocol=pickle5.HIGHEST_PROTOCOL)
     with open(path + "_train_y.pkl", "wb") as handle:
-        pickle5.dump(train_y_data, handle)
-    handle.close()
+        pickle5.dump(train_y_data, handle, protocol=pickle5.HIGHEST_PROTOCOL)
     with open(path + "_test_X.pkl", "wb") as handle:
-        pickle5.dump(test_X_data, handle)
-    handle.close()
+        pickle5.dump(test_X_data, handle, protocol=pickle5.HIGHEST_PROTOCOL)
     with open(path + "_test_y.pkl", "wb") as handle:
-        pickle5.dump(test_y_data, handle)
-    handle.close()
+        pickle5.dump(test_y_data, handle, protocol=pickle5.HIGHEST_PROTOCOL)
     with open(path + "_test_prophages.pkl", "wb") as handle:
-        pickle5.dump(test_phage, handle)
-    handle.close()
+        pickle5.dump(test_phage, handle, protocol=pickle5.HIGHEST_PROTOCOL)
@@ -7,8 +7,10 @@ import random
 import re
 
 # imports
+import numpy as np
 import pandas as pd
 from Bio import SeqIO
+from joblib import Parallel, delayed
 from loguru import logger
 from pandas.errors import EmptyDataError
 
@@ -61,12 +63,34 @@ def get_genbank(genbank):
     return gb_dict
 
 
+def iter_genbank(genbank):
+    """
+    Iterate through the entries of a genbank file without reading the entire file into memory
+
+    param genbank: path to the genbank file which may be gzipped
+    return: generator of genbank entries
+    """
+
+    if is_gzip_file(genbank.strip()):
+        handle = gzip.open(genbank.strip(), "rt")
+    else:
+        handle = open(genbank.strip(), "rt")
+
+    with handle:
+        try:
+            yield from SeqIO.parse(handle, "gb")
+        except ValueError:
+            logger.error(genbank.strip() + " is not a genbank file!")
+            raise
+
+
 def phrog_to_integer(phrog_annot, phrog_integer):
     """
     Converts phrog annotation to its integer representation
     """
 
-    return [phrog_integer.get(i) for i in phrog_annot]
+    # map calls the dictionary lookup directly rather than through a Python loop. Phrogs without a category are None
+    return list(map(phrog_integer.get, phrog_annot))
 
 
 def extract_features(this_phage):
@@ -158,10 +182,10 @@ def shuffle_dict(dictionary):
     :return shuffled dictionary
     """
 
-    keys = list(dictionary.keys())
+    keys = list(dictionary)
     random.shuffle(keys)
 
-    return dict(zip(keys, [dictionary.get(key) for key in keys]))
+    return {key: dictionary[key] for key in keys}
 
 
 def derep_trainingdata(training_data):
@@ -181,19 +205,25 @@ def derep_trainingdata(training_data):
     random.shuffle(training_keys)
 
     # get the categories in each prophage
-    training_encodings = [training_data.get(k).get("categories") for k in training_keys]
-
-    # write a function to remove duplicates in the training data
-    training_str = ["".join([str(j) for j in i]) for i in training_encodings]
-    # training_sense = ["".join(training_data.get(p).get("sense")) for p in training_keys]
+    training_encodings = [training_data[k]["categories"] for k in training_keys]
+
+    # pack each encoding into raw bytes to use as the key for removing duplicates
+    # unrecognised phrogs (None) are kept distinct from the unknown category
+    training_hash = [
+        np.fromiter(
+            (-1 if j is None else j for j in i), dtype=np.int8, count=len(i)
+        ).tobytes()
+        for i in training_encodings
+    ]
+    # training_sense = ["".join(training_data.get(p).get("sense")).encode() for p in training_keys]
     # training_hash = [
-    #    training_sense[i] + training_str[i] for i in range(len(training_keys))
+    #    training_sense[i] + training_hash[i] for i in range(len(training_keys))
     # ]
 
     # get the dereplicated keys
-    dedup_keys = list(dict(zip(training_str, training_keys)).values())
+    dedup_keys = list(dict(zip(training_hash, training_keys)).values())
 
-    return dict(zip(dedup_keys, [training_data.get(d) for d in dedup_keys]))
+    return {d: training_data[d] for d in dedup_keys}
 
 
 def add_predictions(gb_dict, predictions):
@@ -231,80 +261,91 @@ def write_genbank(gb_dict, filename):
     write genbank dictionary to a file
     """
 
-    keys = list(gb_dict.keys())
-
     # check for gzip
     if filename.strip()[-3:] == ".gz":
         with gzip.open(filename, "wt") as handle:
-            for key in keys:
-                SeqIO.write(gb_dict.get(key), handle, "genbank")
-        handle.close()
+            SeqIO.write(gb_dict.values(), handle, "genbank")
 
     else:
         with open(filename, "wt") as handle:
-            for key in keys:
-                SeqIO.write(gb_dict.get(key), handle, "genbank")
-        handle.close()
+            SeqIO.write(gb_dict.values(), handle, "genbank")
 
 
-def get_data(input_data, gene_categories, phrog_integer, maximum_genes=False):
+def process_genbank(genbank, gene_categories, phrog_integer, maximum_genes=False):
+    """
+    Fetch the prophages in a single genbank file which pass the filtering steps
+
+    :param genbank: path to the genbank file
+    :param gene_categories: number of gene categories which must be included
+    :param phrog_integer: dictionary which converts phrogs to category integer encoding
+    :param maximum_genes: maximum number of genes in each prophage. Default of False does not filter
+    :return: dictionary of the prophages in this genbank file which pass the filtering steps
+    """
+
+    training_data = {}
+
+    # prefix for the keys of this genbank file - the file name up to the first comma or full stop
+    g = re.split(",|\.", re.split("/", genbank.strip())[-1])[0]
+
+    # whether to filter on the number of genes
+    filter_genes = maximum_genes != False
+
+    # read each prophage in turn so only those passing the filters are kept
+    for prophage in iter_genbank(genbank):
+        key = prophage.id
+
+        # extract the relevant features
+        phage_dict = extract_features(prophage)
+
+        # skip prophages with too many genes before their categories are counted
+        phrogs = phage_dict["phrogs"]
+        if filter_genes and len(phrogs) > maximum_genes:
+            continue
+
+        # integer encoding of phrog categories
+        integer = phrog_to_integer(phrogs, phrog_integer)
+        phage_dict["categories"] = integer
+
+        # evaluate the number of categories present in the phage excluding the unknown category
+        categories_present = len({i for i in integer if i != 0})
+
+        # if above the minimum number of categories are included
+        if categories_present >= gene_categories:
+            # update dictionary with this entry
+            training_data[g + "_" + key] = phage_dict
+
+    return training_data
+
+
+def get_data(
+    input_data, gene_categories, phrog_integer, maximum_genes=False, threads=1
+):
     """
     Loop to fetch training and test data
 
     :param input_data: path to where the input files are located
     :param gene_categories: number of gene categories which must be included
+    :param phrog_integer: dictionary which converts phrogs to category integer encoding
+    :param maximum_genes: maximum number of genes in each prophage. Default of False does not filter
+    :param threads: number of genbank files to process in parallel
     :return: curated data dictionary
     """
 
     training_data = {}  # dictionary to store all of the training data
 
-    prophage_counter = 0  # count the number of prophages encountered
-    prophage_pass = 0  # number of prophages which pass the filtering steps
-
     with open(input_data, "r", errors="replace") as file:
-        genbank_files = file.readlines()
-
-        for genbank in genbank_files:
-            # convert genbank to a dictionary
-            gb_dict = get_genbank(genbank)
-            gb_keys = list(gb_dict.keys())
-
-            for key in gb_keys:
-                # update the counter
-                prophage_counter += 1
-
-                # extract the relevant features
-                phage_dict = extract_features(gb_dict.get(key))
-
-                # integer encoding of phrog categories
-                integer = phrog_to_integer(phage_dict.get("phrogs"), phrog_integer)
-                phage_dict["categories"] = integer
-
-                # evaluate the number of categories present in the phage
-                categories_present = set(integer)
-                if 0 in categories_present:
-                    categories_present.remove(0)
-
-                if maximum_genes == False:
-                    if len(categories_present) >= gene_categories:
-                        # update the passing candidature
-                        prophage_pass += 1
-
-                        # update dictionary with this entry
-                        g = re.split(",|\.", re.split("/", genbank.strip())[-1])[0]
-                        training_data[g + "_" + key] = phage_dict
-
-                else:
-                    # if above the minimum number of categories are included
-                    if (
-                        len(phage_dict.get("phrogs")) <= maximum_genes
-                        and len(categories_present) >= gene_categories
-                    ):
-                        # update the passing candidature
-                        prophage_pass += 1
-
-                        # update dictionary with this entry
-                        g = re.split(",|\.", re.split("/", genbank.strip())[-1])[0]
-                        training_data[g + "_" + key] = phage_dict
+        # read the file paths one line at a time
+        genbank_files = (genbank.strip() for genbank in file if genbank.strip())
+
+        # each genbank file is processed independently. Results are returned in the order of the input files
+        results = Parallel(n_jobs=threads)(
+            delayed(process_genbank)(
+                genbank, gene_categories, phrog_integer, maximum_genes
+            )
+            for genbank in genbank_files
+        )
+
+    for result in results:
+        training_data.update(result)
 
     return training_data
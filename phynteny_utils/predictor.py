@@ -29,8 +29,6 @@ def get_dict(dict_path):
     with open(dict_path, "rb") as handle:
         dictionary = pickle.load(handle)
 
-    handle.close()
-
     return dictionary
 
 
@@ -68,17 +66,14 @@ def run_phynteny(outfile, gene_predictor, gb_dict, categories):
     :return: annotated dictionary
     """
 
-    # get the list of phages to loop through
-    keys = list(gb_dict.keys())
-
     # Run Phynteny
     with open(outfile, "wt") if outfile != ".gbk" else sys.stdout as handle:
-        for key in keys:
+        for key, record in gb_dict.items():
             # print the phage
             print("Annotating the phage: " + key, flush=True)
 
             # get current phage
-            phages = {key: handle_genbank.extract_features(gb_dict.get(key))}
+            phages = {key: handle_genbank.extract_features(record)}
 
             # get phrog annotations
             phages[key]["phrogs"] = [
@@ -95,7 +90,7 @@ def run_phynteny(outfile, gene_predictor, gb_dict, categories):
 
             if len(predictions) > 0:
                 # update with these annotations
-                cds = [i for i in gb_dict.get(key).features if i.type == "CDS"]
+                cds = [i for i in record.features if i.type == "CDS"]
 
                 # return everything back
                 for i in range(len(unk_idx)):
@@ -107,7 +102,7 @@ def run_phynteny(outfile, gene_predictor, gb_dict, categories):
                     cds[unk_idx[i]].qualifiers["phynteny_confidence"] = confidence[i]
 
             # write to genbank file
-            SeqIO.write(gb_dict.get(key), handle, "genbank")
+            SeqIO.write(record, handle, "genbank")
             logger.info(f"Annotated the phage {key}")
     return gb_dict
 
@@ -117,9 +112,6 @@ def generate_table(outfile, gb_dict, categories, phrog_integer):
     Generate table summary of the annotations made
     """
 
-    # get the list of phages to loop through
-    keys = list(gb_dict.keys())
-
     # count the number of genes found
     found = 0
 
@@ -129,12 +121,12 @@ def generate_table(outfile, gb_dict, categories, phrog_integer):
             "ID\tstart\tend\tstrand\tphrog_id\tphrog_category\tphynteny_category\tphynteny_score\tconfidence\tsequence\tphage\n"
         )
 
-        for k in keys:
+        for k, record in gb_dict.items():
             # obtain the sequence
-            seq = gb_dict.get(k).seq
+            seq = record.seq
 
             # get the genes
-            cds = [f for f in gb_dict.get(k).features if f.type == "CDS"]
+            cds = [f for f in record.features if f.type == "CDS"]
 
             # extract the features for the cds
             start = [c.location.start for c in cds]
@@ -217,6 +209,12 @@ class Predictor:
         )
 
         self.phrog_categories = get_dict(phrog_categories_path)
+
+        # lookup table to convert integer phrog identifiers to their category
+        self.phrog_lookup = np.zeros(max(self.phrog_categories) + 1, dtype=int)
+        self.phrog_lookup[list(self.phrog_categories.keys())] = list(
+            self.phrog_categories.values()
+        )
         self.confidence_dict = get_dict(confidence_dict)
         self.category_names = get_dict(category_names_path)
         self.num_functions = len(self.category_names)
@@ -225,14 +223,14 @@ class Predictor:
         """ """
 
         encodings = [
-            [self.phrog_categories.get(p) for p in phage_dict.get(q).get("phrogs")]
-            for q in list(phage_dict.keys())
+            self.phrog_lookup[np.asarray(phage["phrogs"], dtype=int)]
+            for phage in phage_dict.values()
         ]
 
         if len(encodings[0]) == 0:
             logger.info(f"your phage {list(phage_dict.keys())[0]}  has zero genes!")
 
-        unk_idx = [i for i, x in enumerate(encodings[0]) if x == 0]
+        unk_idx = np.flatnonzero(encodings[0] == 0).tolist()
 
         if len(unk_idx) == 0:
             logger.info(
@@ -253,14 +251,12 @@ class Predictor:
             confidence = []
 
         else:
-            # make data with the categories masked
+            # encode the phage once then mask each unknown gene in turn
+            encoding = format_data.prepare_sequence(
+                encodings[0], self.num_functions, self.max_length
+            )
             X = [
-                format_data.generate_prediction(
-                    encodings,
-                    self.num_functions,
-                    self.max_length,
-                    i,
-                )
+                format_data.apply_mask(encoding, i, self.num_functions)
                 for i in unk_idx
             ]
 
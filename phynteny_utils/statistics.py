@@ -19,13 +19,17 @@ def phynteny_score(X_encodings, num_categories, models):
     :return: per-class phynteny score for the test instance
     """
 
-    # obtain the yhat values
-    scores_list = [
-        predict_softmax(X_encodings, num_categories, models[i])
-        for i in range(len(models))
-    ]
+    # sum the yhat values of each model as they are predicted
+    scores = None
+    for model in models:
+        yhat = predict_softmax(X_encodings, num_categories, model)
+
+        if scores is None:
+            scores = yhat
+        else:
+            np.add(scores, yhat, out=scores)
 
-    return np.array(scores_list).sum(axis=0)
+    return scores
 
 
 def build_confidence_dict(label, prediction, scores, bandwidth, categories):
@@ -88,14 +92,8 @@ def known_category(X_encodings, y_encodings, num_categories):
     :return: list of masked categories
     """
 
-    known_category = list()
-
-    for i in range(len(X_encodings)):
-        # get the known category of the gene
-        y_index = np.argmax(y_encodings[i])
-        known_category.append(y_index)
-
-    return known_category
+    # get the known category of each gene
+    return list(np.argmax(y_encodings, axis=1))
 
 
 def predict_softmax(X_encodings, num_categories, model):
@@ -108,7 +106,7 @@ def predict_softmax(X_encodings, num_categories, model):
     """
 
     # obtain softmax scores for the masked genes
-    X_encodings = np.array(X_encodings)
+    X_encodings = np.asarray(X_encodings, dtype=np.float32)
     yhat = model.predict(X_encodings)
     scores_list = yhat
 
@@ -134,16 +132,9 @@ def build_roc(scores, known_categories, category_names):
 
     # loop through each category
     for i in range(1, len(category_names)):
-        # get items for the category in this iteration
-        include = known_categories == i
-
         # convert the predictions to a series of binary classifications
-        binary_index = [1 for j in known_categories[include]] + [
-            0 for j in known_categories[~include]
-        ]
-        binary_scores = list(normed_scores[include][:, i - 1]) + list(
-            normed_scores[~include][:, i - 1]
-        )
+        binary_index = known_categories == i
+        binary_scores = normed_scores[:, i - 1]
 
         # compute ROC
         fpr, tpr, thresholds = roc_curve(binary_index, binary_scores)
@@ -187,12 +178,9 @@ def build_precision_recall(scores, known_categories, category_names):
 
     # Loop through each category
     for i in range(1, len(category_names)):
-        # Select items for the category in this iteration
-        include = known_categories == i
-
         # Convert the predictions to binary classifications
-        binary_index = [1 for j in known_categories[include]] + [0 for j in known_categories[~include]]
-        binary_scores = list(normed_scores[include][:, i - 1]) + list(normed_scores[~include][:, i - 1])
+        binary_index = known_categories == i
+        binary_scores = normed_scores[:, i - 1]
 
         # Compute Precision-Recall curve
         precision, recall, _ = precision_recall_curve(binary_index, binary_scores)
@@ -230,16 +218,9 @@ def per_category_auc(scores, known_categories, category_names, method="ovr"):
 
     # loop through each category
     for i in range(1, len(category_names)):
-        # get items for the category in this iteration
-        include = known_categories == i
-
         # convert the predictions to a series of binary classifications
-        binary_index = [1 for j in known_categories[include]] + [
-            0 for j in known_categories[~include]
-        ]
-        binary_scores = list(normed_scores[include][:, i - 1]) + list(
-            normed_scores[~include][:, i - 1]
-        )
+        binary_index = known_categories == i
+        binary_scores = normed_scores[:, i - 1]
 
         # compute AUC
         auc_dict[category_names.get(i)] = roc_auc_score(binary_index, binary_scores)
@@ -272,16 +253,9 @@ def per_category_aps(scores, known_categories, category_names):
 
     # loop through each category
     for i in range(1, len(category_names)):
-        # get items for the category in this iteration
-        include = known_categories == i
-
         # convert the predictions to a series of binary classifications
-        binary_index = [1 for j in known_categories[include]] + [
-            0 for j in known_categories[~include]
-        ]
-        binary_scores = list(normed_scores[include][:, i - 1]) + list(
-            normed_scores[~include][:, i - 1]
-        )
+        binary_index = known_categories == i
+        binary_scores = normed_scores[:, i - 1]
 
         # compute AUC
         aps_dict[category_names.get(i)] = average_precision_score(binary_index, binary_scores)
@@ -299,22 +273,32 @@ def norm_scores(scores_list):
     :param scores_list: list of softmax or phynteny scores
     """
 
-    return scores_list[:, 1:] / scores_list[:, 1:].sum(axis=1)[:, np.newaxis]
+    normed_scores = np.array(scores_list[:, 1:], dtype=np.float32)
+    normed_scores /= normed_scores.sum(axis=1, keepdims=True)
+
+    return normed_scores
 
 
 def get_masked(encoding, num_categories):
     """
     Get which indexes are masked in the data. Important  pre-masked testing data/
+    Accepts a single encoded matrix or a batch of encoded matrices
 
-    :param encoding: encoded matrix
+    :param encoding: encoded matrix or array of encoded matrices
     :num_categories: number of gene functional categories in the encoding
-    :return: list of masked indexes
+    :return: masked index, or array of masked indexes for a batch
     """
 
-    return np.where(np.all(encoding[:, :num_categories] == 0, axis=1))[0][0]
+    masked_rows = ~np.asarray(encoding)[..., :num_categories].any(axis=-1)
 
+    # argmax would silently return the first gene if nothing is masked
+    if not masked_rows.any(axis=-1).all():
+        raise ValueError("Encoding has no masked gene")
 
-def class_scores(tt, scores, is_real, prot_class, df):
+    return masked_rows.argmax(axis=-1)
+
+
+def class_scores(tt, scores, is_real, prot_class):
     """
     Function for scoring quality of predictions and geting metrics
     Modified from PhANNs https://github.com/Adrian-Cantu/PhANNs/blob/master/model_training/08_graph.py
@@ -322,7 +306,7 @@ def class_scores(tt, scores, is_real, prot_class, df):
     :param tt: threshold cutoff to apply
     :param is_real:
     :param prot_class: cateogory to predict from
-    :param df: dataframe to append to
+    :return: row of metrics at this threshold or None if there is no support
     """
 
     is_predicted = [x >= tt - 0.05 for x in scores]
@@ -336,7 +320,7 @@ def class_scores(tt, scores, is_real, prot_class, df):
     FP = sum(np.logical_and(np.logical_not(is_real), is_predicted))
 
     if not (TP + TN + FP + FN):
-        return df
+        return None
 
     num_pred = TP + FP
 
@@ -356,14 +340,58 @@ def class_scores(tt, scores, is_real, prot_class, df):
 
     fscore = (2 * TP) / (2 * TP + FP + FN)
     accuracy = (TP + TN) / (TP + TN + FP + FN)
-    data_row = [prot_class, precision, recall, fscore, accuracy, tt, support]
 
-    new_row = pd.DataFrame([data_row], columns=df.columns)
-    df = pd.merge(df, new_row, how="outer")
+    return [prot_class, precision, recall, fscore, accuracy, tt, support]
+
+
+def sweep_thresholds(scores, is_real, prot_class, score_range):
+    """
+    Equivalent to applying class_scores at each threshold in score_range.
+    Counts at each threshold are found by binary search of the sorted scores rather than recomputing every prediction
+
+    :param scores: scores of the predictions made to this category
+    :param is_real: whether each prediction made to this category is correct
+    :param prot_class: category the predictions were made to
+    :param score_range: thresholds to evaluate
+    :return: dataframe of metrics at each threshold which has support
+    """
 
-    # df = df.append(pd.Series(data_row, index=df.columns), sort=False, ignore_index=True)
+    cutoff = score_range - 0.05
+
+    # predictions are made using scores rounded to a single decimal place
+    predicted_scores = np.minimum(scores, np.around(scores, decimals=1))
+
+    def count_above(values):
+        return len(values) - np.searchsorted(np.sort(values), cutoff, side="left")
+
+    # count the genes passing each threshold
+    support_real = count_above(scores[is_real])
+    support_false = count_above(scores[~is_real])
+    TP = count_above(predicted_scores[is_real])
+    FP = count_above(predicted_scores[~is_real])
+    FN = support_real - TP
+    TN = support_false - FP
+    support = support_real + support_false
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(TP + FP > 0, TP / (TP + FP), 0)
+        recall = np.where(TP + FN > 0, TP / (TP + FN), 0)
+        fscore = (2 * TP) / (2 * TP + FP + FN)
+        accuracy = (TP + TN) / support
+
+    df = pd.DataFrame(
+        {
+            "class": prot_class,
+            "precision": precision,
+            "recall": recall,
+            "f1-score": fscore,
+            "accuracy": accuracy,
+            "threshold": score_range,
+            "support": support,
+        }
+    )
 
-    return df
+    return df[support > 0]
 
 
 def threshold_metrics(scores, known_categories, category_names):
@@ -376,35 +404,22 @@ def threshold_metrics(scores, known_categories, category_names):
     :param category_names: dictionary of category labels
     """
 
-    d = {
-        "class": [],
-        "precision": [],
-        "recall": [],
-        "f1-score": [],
-        "accuracy": [],
-        "threshold": [],
-        "support": [],
-    }
-
     score_range = np.arange(0, 10.1, 0.01)
-    df_test_score = pd.DataFrame(data=d)
 
-    scores_index = np.array([np.argmax(i) for i in scores])
+    scores_index = np.argmax(scores, axis=1)
     known_categories = np.array(known_categories)
 
     # loop through each category and take the predictions made to that class (regardless whether successful)
+    class_metrics = []
     for num in range(1, len(category_names)):
         test_set_p = scores[scores_index == num, num]
         test_set_t = known_categories[scores_index == num] == num
 
-        for tt in score_range:
-            df_test_score = class_scores(
-                tt,
-                np.around(test_set_p[test_set_p >= tt - 0.05], decimals=1),
-                test_set_t[test_set_p >= tt - 0.05],
-                num,
-                df_test_score,
-            )
+        class_metrics.append(
+            sweep_thresholds(test_set_p, test_set_t, num, score_range)
+        )
+
+    df_test_score = pd.concat(class_metrics, ignore_index=True)
 
     # TODO test the effect of removing the 0.05. Why did PHANNs include this to begin with
     df_test_score["class"] = [int(i) for i in df_test_score["class"]]
@@ -424,36 +439,41 @@ def confidence_metrics(scores, confidence_out, known_categories, category_names)
     :param category_names: dictionary of category labels
     """
 
-    d = {
-        "class": [],
-        "precision": [],
-        "recall": [],
-        "f1-score": [],
-        "accuracy": [],
-        "confidence": [],
-        "support": [],
-    }
+    columns = [
+        "class",
+        "precision",
+        "recall",
+        "f1-score",
+        "accuracy",
+        "confidence",
+        "support",
+    ]
 
     score_range = np.arange(0, 1.01, 0.001)
-    df_test_score = pd.DataFrame(data=d)
 
-    scores_index = np.array([np.argmax(i) for i in scores])
+    scores_index = np.argmax(scores, axis=1)
     known_categories = np.array(known_categories)
 
     # loop through each category and take the predictions made to that class (regardless whether successful)
+    rows = []
     for num in range(1, len(category_names)):
         test_set_p = confidence_out[scores_index == num]
         test_set_t = known_categories[scores_index == num] == num
 
         for tt in score_range:
-            df_test_score = class_scores(
+            data_row = class_scores(
                 tt,
                 np.around(test_set_p[test_set_p >= tt - 0.05], decimals=1),
                 test_set_t[test_set_p >= tt - 0.05],
                 num,
-                df_test_score,
             )
 
+            if data_row is not None:
+                rows.append(data_row)
+
+    # build the dataframe once all of the rows are collected
+    df_test_score = pd.DataFrame(rows, columns=columns)
+
     # TODO test the effect of removing the 0.05. Why did PHANNs include this to begin with
     df_test_score["class"] = [int(i) for i in df_test_score["class"]]
     df_test_score["category"] = [category_names.get(i) for i in df_test_score["class"]]
@@ -472,7 +492,8 @@ def compute_confidence(scores, confidence_dict, categories):
     """
 
     # get the prediction for each score
-    score_predictions = np.array([np.argmax(score) for idx, score in enumerate(scores)])
+    scores = np.asarray(scores)
+    score_predictions = scores.argmax(axis=1)
 
     # make an array to store the confidence of each prediction
     confidence_out = np.zeros(len(scores))
@@ -481,7 +502,7 @@ def compute_confidence(scores, confidence_dict, categories):
     # loop through each of potential categories
     for i in range(1, 10):
         # get the scores relevant to the current category
-        cat_scores = np.array(scores)[score_predictions == i]
+        cat_scores = scores[score_predictions == i]
 
         if len(cat_scores) > 0:
             # compute the kernel density estimates
@@ -1,4 +1,5 @@
 # imports
+import os
 import random
 
 import absl.logging
@@ -9,15 +10,19 @@ import tensorflow as tf
 import tensorflow.keras.initializers as initializers
 import tensorflow.keras.optimizers as optimizers
 from sklearn.model_selection import StratifiedKFold, train_test_split
-from tensorflow.keras import Sequential
-from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
-from tensorflow.keras.layers import LSTM, Bidirectional, Dense, TimeDistributed
+from tensorflow.keras import Sequential, mixed_precision
+from tensorflow.keras.callbacks import BackupAndRestore, EarlyStopping, ModelCheckpoint
+from tensorflow.keras.layers import LSTM, Bidirectional, Dense, Dropout, TimeDistributed
 from tensorflow.keras.regularizers import L1L2
 
 from phynteny_utils import format_data
 
 absl.logging.set_verbosity(absl.logging.ERROR)
 
+# allocate GPU memory as it is needed rather than reserving the whole device
+for gpu in tf.config.list_physical_devices("GPU"):
+    tf.config.experimental.set_memory_growth(gpu, True)
+
 
 def get_dict(dict_path):
     """
@@ -26,11 +31,45 @@ def get_dict(dict_path):
 
     with open(dict_path, "rb") as handle:
         dictionary = pickle5.load(handle)
-    handle.close()
 
     return dictionary
 
 
+def get_array(array_path):
+    """
+    Helper function to import a dataset as an array. Arrays saved as .npy are memory-mapped, which loads much faster
+    than unpickling a dictionary. This does not reduce memory use during training as the whole array is read into
+    memory when the data is converted for training
+
+    :param array_path: path to a .npy array or a pickled dictionary of arrays
+    :return: dataset as an array
+    """
+
+    if array_path.endswith(".npy"):
+        return np.load(array_path, mmap_mode="r")
+
+    dictionary = get_dict(array_path)
+
+    return np.array(list(dictionary.values()))
+
+
+def get_labels(y):
+    """
+    Convert one-hot encoded y data to integer labels of the masked category. Training with integer labels stores a
+    single value for each instance rather than a vector of length num_functions
+
+    :param y: one-hot encoded y data or integer labels
+    :return: integer labels for each instance
+    """
+
+    y = np.asarray(y)
+
+    if y.ndim > 1:
+        y = np.argmax(y, axis=1)
+
+    return y.astype(np.int32)
+
+
 def get_optimizer(optimizer_function, learning_rate):
     """
     Get the optimization function to train the LSTM based on the provided inputs
@@ -48,13 +87,13 @@ def get_optimizer(optimizer_function, learning_rate):
     elif optimizer_function == "adagrad":
         optimizer = optimizers.Adagrad(learning_rate=learning_rate)
     elif optimizer_function == "sgd":
-        optimizer_function = optimizers.SGD(learning_rate=learning_rate)
+        optimizer = optimizers.SGD(learning_rate=learning_rate)
     else:
         raise ValueError(
             "Invalid optimizer function. Must be One of ['adam', 'rmsprop', 'adagrad', 'sgd']"
         )
 
-    return optimizer_function
+    return optimizer
 
 
 def get_initializer(initializer_function):
@@ -86,6 +125,72 @@ def get_initializer(initializer_function):
     return kernel_initializer
 
 
+def get_strategy():
+    """
+    Get the distribution strategy to train with.
+    When more than one GPU is available the model is replicated across each GPU and kept in sync
+
+    :return: distribution strategy
+    """
+
+    gpus = tf.config.list_logical_devices("GPU")
+
+    if len(gpus) > 1:
+        return tf.distribute.MirroredStrategy([gpu.name for gpu in gpus])
+
+    return tf.distribute.get_strategy()
+
+
+def build_dataset(X, y, batch_size, shuffle=False, shuffle_buffer=0, index=None):
+    """
+    Build an input pipeline to parse data to the model during training
+
+    :param X: X data for the model
+    :param y: y data for the model
+    :param batch_size: batch size for training
+    :param shuffle: whether to shuffle the instances between each epoch
+    :param shuffle_buffer: number of instances to shuffle between each epoch when X and y are sliced directly. Has no
+    effect when index is given as every instance is then shuffled. Default of 0 does not shuffle
+    :param index: indices of the instances in X and y to include. Default of None includes all instances
+    :return: batched dataset which prepares the next batch while the current batch is training
+    """
+
+    if index is None:
+        dataset = tf.data.Dataset.from_tensor_slices((X, y))
+
+        if shuffle and shuffle_buffer:
+            dataset = dataset.shuffle(shuffle_buffer, reshuffle_each_iteration=True)
+
+    else:
+        # only the indices are sliced and each batch is gathered from the shared data so that a subset does not
+        # need its own copy of the data
+        dataset = tf.data.Dataset.from_tensor_slices(index)
+
+        # the buffer only holds indices so every instance is shuffled between each epoch. The indices are sorted so a
+        # smaller buffer would give nearly the same order in every epoch
+        if shuffle:
+            dataset = dataset.shuffle(len(index), reshuffle_each_iteration=True)
+
+    dataset = dataset.batch(batch_size)
+
+    if index is not None:
+        # gather batches on parallel threads so they are ready before the GPU needs them
+        dataset = dataset.map(
+            lambda i: (tf.gather(X, i), tf.gather(y, i)),
+            num_parallel_calls=tf.data.AUTOTUNE,
+        )
+
+    # X may be stored as int8 to save memory so it is cast for the model one batch at a time
+    dataset = dataset.map(
+        lambda X_batch, y_batch: (tf.cast(X_batch, tf.float32), y_batch),
+        num_parallel_calls=tf.data.AUTOTUNE,
+    )
+
+    # prefetch is applied last so that only whole batches are buffered. Nothing is cached so memory does not
+    # grow across epochs
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
 class Model:
     def __init__(
         self,
@@ -105,13 +210,18 @@ class Model:
         l1_regularizer=0,
         l2_regularizer=0,
         kernel_initializer="zeros",
+        use_xla=False,
+        use_mixed_precision=False,
+        debug=False,
+        resume=False,
     ):
         """
         :param phrog_categories_path: location of the dictionary describing the phrog_categories :param
         :param max_length: maximum length of prophage to consider
         :param layers: number of hidden layers to use in the model
         :param neurons: number of memory cells in hidden layers
-        :param batch_size: batch size for training
+        :param batch_size: batch size for training on each GPU. When training across multiple GPUs the global batch
+        size is batch_size multiplied by the number of GPUs
         :param kernel_regularizer: kernel regulzarizer
         :param dropout: dropout rate to implement
         :param optimizer_function: which optimization function to use
@@ -119,6 +229,11 @@ class Model:
         :param learning_rate: learning rate for training
         :param patience: number of epochs with no improvement after which training will be stopped
         :param min_delta: minimum change in validation loss considered an improvement
+        :param use_xla: whether to compile the training step with XLA. Experimental as this disables the cuDNN LSTM kernel
+        :param use_mixed_precision: whether to train with mixed float16 precision. Requires a GPU with tensor cores
+        :param debug: whether to print the model summary and cross-validation splits
+        :param resume: whether to back up the training state each epoch so that an interrupted run can be resumed. The
+        backup is named only from the output prefix so a resumed run must use the same hyperparameters
         """
 
         # set general information for the model
@@ -138,6 +253,21 @@ class Model:
         self.activation = activation
         self.optimizer_function = optimizer_function
         self.learning_rate = learning_rate
+        self.use_xla = use_xla
+        self.debug = debug
+        self.resume = resume
+
+        # LSTM layers compute in float16 while the variables are kept in float32. Keras adds loss scaling to the
+        # optimizer when the model is compiled under this policy. The policy applies to the whole process so it is
+        # reset for models which do not use mixed precision
+        if use_mixed_precision:
+            mixed_precision.set_global_policy("mixed_float16")
+        else:
+            mixed_precision.set_global_policy("float32")
+
+        # strategy for distributing training across the available GPUs. Each batch is split evenly between the GPUs
+        self.strategy = get_strategy()
+        self.global_batch_size = self.batch_size * self.strategy.num_replicas_in_sync
 
         # set early stopping conditions
         self.patience = patience
@@ -147,36 +277,45 @@ class Model:
         self.X = []
         self.y = []
 
-    def fit_data(self, data_path):
+    def fit_data(self, data):
         """
-        Fit data to model object
+        Fit data to model object. The data is encoded as float32 and then stored as int8, so peak memory is
+        approximately 4 x number of prophages x max_length x num_functions bytes
+
+        :param data: path to the pickled training data or the already loaded dictionary
         """
 
         # get data from specified path
-        data = get_dict(data_path)
+        if isinstance(data, str):
+            data = get_dict(data)
 
         # process the data
-        self.X, self.y = format_data.generate_dataset(
-            data, self.num_functions, self.max_length
-        )
+        X, y = format_data.generate_dataset(data, self.num_functions, self.max_length)
+
+        # the one-hot encodings are stored as int8 which is a quarter of the memory of float32
+        self.X = X.astype(np.int8)
+        self.y = get_labels(y)
 
     def parse_masked_data(self, X_path, y_path):
         """
         Parse a pre-masked dataset
+
+        :param X_path: path to the X data. Either a pickled dictionary or a .npy array
+        :param y_path: path to the y data. Either a pickled dictionary or a .npy array
         """
-        # get the X data
-        X = get_dict(X_path)
-        self.X = np.array(list(X.values()))
+        # get the X data. The one-hot encodings are stored as int8 which is a quarter of the memory of float32
+        self.X = get_array(X_path).astype(np.int8, copy=False)
 
         # get the y data
-        y = get_dict(y_path)
-        self.y = np.array(list(y.values()))
+        self.y = get_labels(get_array(y_path))
 
-    def get_callbacks(self, model_out):
+    def get_callbacks(self, model_out, best_val_loss=None):
         """
         Callbacks to use for training the LSTM
 
         :param model_out: the prefix of the model output
+        :param best_val_loss: validation loss of the best model saved before training was interrupted. Default of None
+        saves the first epoch
         """
 
         es = EarlyStopping(
@@ -187,24 +326,23 @@ class Model:
             min_delta=self.min_delta,
         )
 
+        # only the model with the best validation loss is written. The full model is saved as it is loaded by the
+        # predictor
         mc = ModelCheckpoint(
-            model_out + "best_val_accuracy.h5",
+            model_out + "best_val_loss.h5",
             monitor="val_loss",
             mode="min",
             save_best_only=True,
-            verbose=1,
-            save_freq="epoch",
-        )  # model with the best validation loss therefore minimise
-        mc2 = ModelCheckpoint(
-            model_out + "best_val_loss.h5",
-            monitor="val_accuracy",
-            mode="max",
-            save_best_only=True,
-            verbose=1,
+            verbose=0,
             save_freq="epoch",
+            initial_value_threshold=best_val_loss,
         )
 
-        callbacks = [es, mc, mc2]
+        callbacks = [es, mc]
+
+        # keep the training state so an interrupted run resumes from the last completed epoch
+        if self.resume:
+            callbacks.append(BackupAndRestore(backup_dir=model_out + "backup"))
 
         return callbacks
 
@@ -215,61 +353,45 @@ class Model:
         :return: model ready to be trained
         """
 
-        print("building model")
         # define the model
         model = Sequential()
 
         # get the kernel initializer
         kernel_initializer = get_initializer(self.kernel_intializer)
 
-        print("Number of layers: " + str(self.layers))
-
-        # loop to add layers to the model
+        # dropout is applied between layers rather than within the LSTM cells so that the cuDNN kernel can be used
+        # on GPU. This also requires the default tanh activation
         for layer in range(self.layers):
-            # add the input layer
-            if layer < self.layers - 1:
-                print("adding a layer")
-                model.add(
-                    Bidirectional(
-                        LSTM(
-                            self.neurons,
-                            return_sequences=True,
-                            dropout=self.dropout,
-                            kernel_regularizer=self.kernel_regularizer,
-                            kernel_initializer=kernel_initializer,
-                            activation=self.activation,
-                        ),
-                        input_shape=(self.max_length, self.num_functions),
-                    )
-                )
-
-            # add the final hidden layer
-            else:
-                print("adding the last layer")
-
-                model.add(
-                    Bidirectional(
-                        LSTM(
-                            self.neurons,
-                            dropout=self.dropout,
-                            kernel_regularizer=self.kernel_regularizer,
-                            kernel_initializer=kernel_initializer,
-                            activation=self.activation,
-                        ),
-                        input_shape=(self.max_length, self.num_functions),
-                    )
+            # hidden layers return the full sequence to the next layer and the final hidden layer returns its last
+            # output only
+            model.add(
+                Bidirectional(
+                    LSTM(
+                        self.neurons,
+                        return_sequences=layer < self.layers - 1,
+                        kernel_regularizer=self.kernel_regularizer,
+                        kernel_initializer=kernel_initializer,
+                        activation=self.activation,
+                    ),
+                    input_shape=(self.max_length, self.num_functions),
                 )
+            )
+            model.add(Dropout(self.dropout))
 
-        # output layer
-        model.add(Dense(self.num_functions, activation="softmax"))
+        # output layer. The softmax is kept in float32 so that the loss is numerically stable with mixed precision
+        model.add(Dense(self.num_functions, activation="softmax", dtype="float32"))
 
         # get the optimization function
         optimizer = get_optimizer(self.optimizer_function, self.learning_rate)
 
         model.compile(
-            loss="categorical_crossentropy", metrics=["accuracy"], optimizer=optimizer
+            loss="sparse_categorical_crossentropy",
+            metrics=["accuracy"],
+            optimizer=optimizer,
+            jit_compile=self.use_xla,
         )
-        print(model.summary(), flush=True)
+        if self.debug:
+            model.summary()
 
         return model
 
@@ -283,30 +405,73 @@ class Model:
         history_out="history",
         epochs=140,
         save=True,
+        shuffle_buffer=2048,
     ):
         """
         Function to train the LSTM model and save the trained model
 
         :param X_1: X training data for the model
-        :param y_1: y training data for the model
+        :param y_1: y training data for the model as integer labels
         :param X_val: X validation data for the model
-        :param y_val: y validation data for the model
+        :param y_val: y validation data for the model as integer labels
+        :param model_out: string - prefix of model output
+        :param history_out: string - prefix of history dictionary output
+        :param epochs: number of epochs to train the model for
+        :param save: whether to save the model - default = True
+        :param shuffle_buffer: number of training instances shuffled between each epoch. The whole training set is not
+        shuffled as the buffer holds a copy of each instance
+        """
+
+        self.fit_model(
+            build_dataset(
+                X_1,
+                y_1,
+                self.global_batch_size,
+                shuffle=True,
+                shuffle_buffer=shuffle_buffer,
+            ),
+            build_dataset(X_val, y_val, self.global_batch_size),
+            model_out=model_out,
+            history_out=history_out,
+            epochs=epochs,
+            save=save,
+        )
+
+    def fit_model(
+        self,
+        train_dataset,
+        val_dataset,
+        model_out="model",
+        history_out="history",
+        epochs=140,
+        save=True,
+    ):
+        """
+        Function to train the LSTM model on prepared datasets and save the trained model
+
+        :param train_dataset: batched training dataset generated by build_dataset
+        :param val_dataset: batched validation dataset generated by build_dataset
         :param model_out: string - prefix of model output
         :param history_out: string - prefix of history dictionary output
         :param epochs: number of epochs to train the model for
         :param save: whether to save the model - default = True
         """
 
-        # model with the best validation set accuracy therefore maximise
-        model = self.generate_LSTM()
+        # build the model on every GPU used for training
+        with self.strategy.scope():
+            model = self.generate_LSTM()
+
+        # when resuming, the checkpoint only replaces the saved model if a later epoch improves on it
+        best_val_loss = None
+        if self.resume and os.path.exists(model_out + "best_val_loss.h5"):
+            best_model = tf.keras.models.load_model(model_out + "best_val_loss.h5")
+            best_val_loss = best_model.evaluate(val_dataset, verbose=0)[0]
 
         history = model.fit(
-            X_1,
-            y_1,
+            train_dataset,
             epochs=epochs,
-            batch_size=self.batch_size,
-            callbacks=self.get_callbacks(model_out),
-            validation_data=(X_val, y_val),
+            callbacks=self.get_callbacks(model_out, best_val_loss),
+            validation_data=val_dataset,
             verbose=1,
         )
 
@@ -338,12 +503,10 @@ class Model:
         :param include: which kfolds to use for training. Default is to loop through all of the kfolds.
         """
 
-        # get the masked category in each instance
-        print("categories", flush=True)
-        masked_cat = [np.where(self.y[i] == 1)[0][0] for i in range(len(self.y))]
+        # the labels are the masked category in each instance
+        masked_cat = self.y
 
         # split into kfolds which are stratified
-        print("skf")
         skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
 
         # count the number of folds
@@ -356,7 +519,9 @@ class Model:
             train_index_kfold.append(train_index)
             val_index_kfold.append(val_index)
 
-        print(val_index_kfold)
+        if self.debug:
+            print(val_index_kfold)
+
         # create list of kfolds to consider
         kfolds = []
         if include == 0:
@@ -365,27 +530,24 @@ class Model:
             kfolds = [include - 1]
             counter = include - 1
 
-        for k in kfolds:
-            # generate stratified test and train sets
-            X_train = self.X[train_index_kfold[k], :, :]
-            y_train = self.y[train_index_kfold[k], :]
-
-            # generate validation data for the training
-            X_val = self.X[val_index_kfold[k], :, :]
-            y_val = self.y[val_index_kfold[k], :]
+        # convert the data once so that every fold gathers its batches from the same copy in host memory
+        with tf.device("/cpu:0"):
+            X = tf.convert_to_tensor(self.X)
+            y = tf.convert_to_tensor(self.y)
 
-            # reshape
-            # print('reshaping')
-            # print(y_train.shape)
-            # y_train = y_train.reshape((len(y_train), self.num_functions))
-            # y_val = y_val.reshape((len(y_val), self.num_functions))
+        for k in kfolds:
+            # generate stratified train and validation sets
+            train_dataset = build_dataset(
+                X, y, self.global_batch_size, shuffle=True, index=train_index_kfold[k]
+            )
+            val_dataset = build_dataset(
+                X, y, self.global_batch_size, index=val_index_kfold[k]
+            )
 
             # use the compile function here
-            self.train_model(
-                X_train,
-                y_train,
-                X_val,
-                y_val,
+            self.fit_model(
+                train_dataset,
+                val_dataset,
                 model_out=model_out + ".rep_" + str(counter) + ".",
                 history_out=history_out + ".rep_" + str(counter) + ".",
                 epochs=epochs,
@@ -501,6 +663,9 @@ def random_search(
 
     check_parameters(hyperparameters, num_trials)
 
+    # read the training data once rather than for every trial
+    data = get_dict(data_path)
+
     # initialise helper variables
     tried_params = []
     best_params = None
@@ -517,7 +682,7 @@ def random_search(
 
         # create a model object using the hyperparameters
         model = Model(**params)
-        model.fit_data(data_path)  # data is the path to the training data
+        model.fit_data(data)
 
         # perform stratified cross validation
         model.train_crossValidation(
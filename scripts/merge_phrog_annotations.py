@@ -2,34 +2,45 @@
 Add mmseqs annotations into phispy annotations 
 """
 
-import gzip
+import glob
 import os
 import re
 
 # imports
-import glob2
 import handle_genbank
 from Bio import SeqIO, bgzf
 
+
+def iter_gbk_gz(root):
+    """
+    Recursively yield the paths of the gzipped genbank files below a directory
+
+    :param root: directory to search
+    :return: generator of genbank file paths
+    """
+
+    for entry in os.scandir(root):
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_gbk_gz(entry.path)
+        elif entry.name.endswith('gbk.gz'):
+            yield entry.path
+
+
 # read through each genome
-directories = glob2.glob('/home/edwa0468/phage/Prophage/phispy/phispy/GCA/' + '/*', recursive=True)
+directories = [entry.path for entry in os.scandir('/home/edwa0468/phage/Prophage/phispy/phispy/GCA/') if entry.is_dir()]
 
 for d in directories:
 
-    e = glob2.glob(d + '/**',cd GI recursive=True)
-    zipped_gdict = [i for i in e if i[-6:] == 'gbk.gz']
-
-    for file in zipped_gdict:
+    for file in iter_gbk_gz(d):
 
         # convert genbank to a dictionary
         gb_dict = handle_genbank.get_genbank(file)
-        gb_keys = list(gb_dict.keys())
 
         file_parts = re.split('/', file)
         genbank_parts = re.split('_', file_parts[11])
         mmseqs = '/home/edwa0468/phage/Prophage/phispy/phispy_phrogs/GCA/' + file_parts[8] + '/' + file_parts[9] + '/' + \
                  file_parts[10]
-        mmseqs_fetch = glob2.glob(mmseqs + '/*')
+        mmseqs_fetch = glob.glob(mmseqs + '/*')
  
         #check that there is an mmseqs file present (length is greate than 0) 
         if len(mmseqs_fetch) > 0:
@@ -44,17 +55,15 @@ for d in directories:
                         9] + '/' + file_parts[10] + '/' + genbank_parts[0] + '_' + genbank_parts[1] + '_phrogs_' + \
                                    genbank_parts[3]
 
-                    # write to the genbank file
+                    # write to the genbank file. BGZF output is readable by gzip and is compressed in independent
+                    # blocks which can be accessed without decompressing the whole file
                     print(genbank_name, flush=True)
-                    with gzip.open(genbank_name, 'wt') as handle:
+                    with bgzf.BgzfWriter(genbank_name, 'wb') as handle:
 
                         # loop through each prophage
-                        for key in gb_keys:
-
-                            # get a prophage
-                            this_prophage = gb_dict.get(key)
+                        for key, this_prophage in gb_dict.items():
 
-                            # get the cds
-                            cds = [i for i in this_prophage.features if i.type == 'CDS']
+                            # get the cds. A generator is used as the proteins are only looped through once
+                            cds = (i for i in this_prophage.features if i.type == 'CDS')
 
                             # loop through each protein
@@ -70,7 +70,7 @@ def main(base, x, y, out):
         {
             "true_category": known_categories,
             "predicted_category": predictions_out,
-            "phynteny_score": [np.max(i) for i in scores],
+            "phynteny_score": scores.max(axis=1),
             "confidence": confidence_out,
         }
     )
@@ -43,9 +43,7 @@ def main(input_data, gene_categories, prefix):
             "phynteny_utils", "phrog_annotation_info/phrog_integer.pkl"
         )
     )
-    phrog_integer = dict(
-        zip([str(i) for i in phrog_integer.keys()], phrog_integer.values())
-    )
+    phrog_integer = {str(k): v for k, v in phrog_integer.items()}
     phrog_integer["No_PHROG"] = 0
     num_functions = len(list(set(phrog_integer.values())))
 
@@ -0,0 +1,94 @@
+# imports
+import numpy as np
+import pandas as pd
+import pytest
+
+from phynteny_utils import statistics
+
+CATEGORY_NAMES = {
+    0: "unknown function",
+    1: "connector",
+    2: "DNA, RNA and nucleotide metabolism",
+    3: "head and packaging",
+    4: "integration and excision",
+    5: "lysis",
+}
+
+
+def reference_metrics(scores, known_categories, category_names):
+    """apply class_scores at every threshold as threshold_metrics originally did"""
+    score_range = np.arange(0, 10.1, 0.01)
+    scores_index = np.argmax(scores, axis=1)
+    known_categories = np.array(known_categories)
+
+    rows = []
+    for num in range(1, len(category_names)):
+        test_set_p = scores[scores_index == num, num]
+        test_set_t = known_categories[scores_index == num] == num
+
+        for tt in score_range:
+            keep = test_set_p >= tt - 0.05
+            row = statistics.class_scores(
+                tt, np.around(test_set_p[keep], decimals=1), test_set_t[keep], num
+            )
+            if row is not None:
+                rows.append(row)
+
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "class",
+            "precision",
+            "recall",
+            "f1-score",
+            "accuracy",
+            "threshold",
+            "support",
+        ],
+    )
+
+
+def check_threshold_metrics(scores, known_categories):
+    """compare the rows of threshold_metrics against the per-threshold reference"""
+    expected = reference_metrics(scores, known_categories, CATEGORY_NAMES)
+    observed = statistics.threshold_metrics(scores, known_categories, CATEGORY_NAMES)
+
+    assert len(observed) == len(expected)
+    assert list(observed["class"]) == list(expected["class"])
+    assert list(observed["support"]) == list(expected["support"])
+    assert list(observed["category"]) == [
+        CATEGORY_NAMES.get(i) for i in expected["class"]
+    ]
+    for column in ["precision", "recall", "f1-score", "accuracy", "threshold"]:
+        np.testing.assert_allclose(
+            observed[column].to_numpy(dtype=float),
+            expected[column].to_numpy(dtype=float),
+        )
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_threshold_metrics_random_scores(seed):
+    """random scores with some categories never predicted"""
+    rng = np.random.default_rng(seed)
+    num_genes = 200
+
+    scores = rng.random((num_genes, len(CATEGORY_NAMES)))
+    # categories 2 and 4 are never the top prediction
+    scores[:, [2, 4]] = 0
+    known_categories = rng.integers(0, len(CATEGORY_NAMES), num_genes)
+
+    check_threshold_metrics(scores, known_categories)
+
+
+def test_threshold_metrics_rounding_edges():
+    """scores which sit exactly on the x.x5 rounding edges"""
+    rng = np.random.default_rng(42)
+    edges = np.around(np.arange(0.05, 1, 0.1), decimals=2)
+    num_genes = len(edges) * 20
+
+    scores = np.zeros((num_genes, len(CATEGORY_NAMES)))
+    predicted = rng.choice([1, 3, 5], num_genes)
+    scores[np.arange(num_genes), predicted] = np.repeat(edges, 20)
+    known_categories = rng.integers(0, len(CATEGORY_NAMES), num_genes)
+
+    check_threshold_metrics(scores, known_categories)
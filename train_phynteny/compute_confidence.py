@@ -7,6 +7,7 @@ import pickle
 import click
 import numpy as np
 import pandas as pd
+import pickle5
 import pkg_resources
 import tensorflow as tf
 
@@ -38,9 +39,9 @@ def main(base, x, y, out):
     category_names = pickle.load(open(category_path, "rb"))
 
     # fetch the testing data
-    test_X = pickle.load(open(x, "rb"))
+    test_X = pickle5.load(open(x, "rb"))
     test_X = list(test_X.values())
-    test_y = pickle.load(open(y, "rb"))
+    test_y = pickle5.load(open(y, "rb"))
     test_y = list(test_y.values())
 
     # fetch the models
@@ -52,8 +53,8 @@ def main(base, x, y, out):
     scores = statistics.phynteny_score(test_X, len(category_names), models)
 
     # get the labels and the predcted labels
-    label = np.array([np.argmax(i) for i in test_y])
-    prediction = np.array([np.argmax(score) for idx, score in enumerate(scores)])
+    label = np.argmax(test_y, axis=1)
+    prediction = scores.argmax(axis=1)
 
     # generate dictionary to sae the confidence dictionary
     bandwidth = np.arange(0, 5, 0.005)[1:]
@@ -62,7 +63,8 @@ def main(base, x, y, out):
     )
 
     # save the confidence dictionary
-    pickle.dump(confidence_dict, open(out, "wb"))
+    with open(out, "wb") as handle:
+        pickle.dump(confidence_dict, handle, protocol=pickle.HIGHEST_PROTOCOL)
 
     print("FINISHED")
 
@@ -38,7 +38,14 @@ from phynteny_utils import format_data, handle_genbank
 @click.option(
     "--unmask", "-u", is_flag=True, help="Don't mask a random gene in each genome"
 )
-def main(input_data, gene_categories, maximum_genes, prefix, unmask):
+@click.option(
+    "--threads",
+    "-t",
+    type=int,
+    help="Number of genbank files to process in parallel",
+    default=1,
+)
+def main(input_data, gene_categories, maximum_genes, prefix, unmask, threads):
     print("STARTING")
 
     # read in annotations
@@ -47,16 +54,14 @@ def main(input_data, gene_categories, maximum_genes, prefix, unmask):
             "phynteny_utils", "phrog_annotation_info/phrog_integer.pkl"
         )
     )
-    phrog_integer = dict(
-        zip([str(i) for i in phrog_integer.keys()], phrog_integer.values())
-    )
+    phrog_integer = {str(k): v for k, v in phrog_integer.items()}
     phrog_integer["No_PHROG"] = 0
     num_functions = len(list(set(phrog_integer.values())))
 
     # takes a text file where each line is the file path to genbank files of phages to train a model
     print("getting input", flush=True)
     data = handle_genbank.get_data(
-        input_data, gene_categories, phrog_integer, maximum_genes
+        input_data, gene_categories, phrog_integer, maximum_genes, threads
     )  # dictionary to store all of the training data
 
     # save the training data dictionary
@@ -13,8 +13,16 @@ from phynteny_utils import train_model
 
 @click.command()
 # @click.option("--data", "-d", help="File path to training data")
-@click.option("--x_path", "-x", help="File path to X training data")
-@click.option("--y_path", "-y", help="File path to y training data")
+@click.option(
+    "--x_path",
+    "-x",
+    help="File path to X training data. Either a pickled dictionary or a .npy array",
+)
+@click.option(
+    "--y_path",
+    "-y",
+    help="File path to y training data. Either a pickled dictionary or a .npy array",
+)
 @click.option(
     "--max_length",
     "-ml",
@@ -123,6 +131,28 @@ from phynteny_utils import train_model
     #    type=click.Choice(["zeros", "random_normal", "random_uniform", "truncated_normal"]),
     help="kernel initializer",
 )
+@click.option(
+    "--xla",
+    is_flag=True,
+    help="Compile the training step with XLA. Experimental for this model: XLA cannot compile the cuDNN LSTM kernel "
+    "so the slower generic LSTM implementation is used instead",
+)
+@click.option(
+    "--mixed_precision",
+    is_flag=True,
+    help="Train with mixed float16 precision. Requires a GPU with tensor cores (Volta or newer)",
+)
+@click.option(
+    "--debug",
+    is_flag=True,
+    help="Print the model summary and cross-validation splits",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Back up the training state each epoch so an interrupted run can be resumed by rerunning with the same "
+    "options",
+)
 @click.option(
     "--include",
     "-i",
@@ -150,6 +180,10 @@ def main(
     l1_regularize,
     l2_regularize,
     kernel_initializer,
+    xla,
+    mixed_precision,
+    debug,
+    resume,
     include,
 ):
     print("STARTING")
@@ -171,6 +205,10 @@ def main(
         l1_regularizer=l1_regularize,
         l2_regularizer=l2_regularize,
         kernel_initializer=kernel_initializer,
+        use_xla=xla,
+        use_mixed_precision=mixed_precision,
+        debug=debug,
+        resume=resume,
     )
 
     # fit data to the model